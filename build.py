@@ -4,171 +4,83 @@ Build script to create a standalone Ubik AI executable
 """
 import os
 import sys
+import argparse
 import subprocess
 import shutil
+import site
+import importlib.util
 from pathlib import Path
+from typing import List
 
 
-def run_command(cmd: str, cwd: str = None) -> bool:
-    """Run a command and return success status"""
-    print(f"🔧 Running: {cmd}")
+# Persistent pip cache so repeated builds don't re-download wheels
+PIP_CACHE_DIR = Path.home() / ".cache" / "ubik-pip"
+
+
+def run_command(cmd: List[str], cwd: str = None, env: dict = None) -> bool:
+    """Run a command, streaming its output, and return success status"""
+    print(f"🔧 Running: {' '.join(cmd)}")
     try:
-        result = subprocess.run(cmd, shell=True, cwd=cwd, check=True, 
-                               capture_output=True, text=True)
+        subprocess.run(cmd, cwd=cwd, env=env, check=True)
         return True
-    except subprocess.CalledProcessError as e:
+    except (subprocess.CalledProcessError, OSError) as e:
         print(f"❌ Command failed: {e}")
-        print(f"❌ Error output: {e.stderr}")
         return False
 
 
 def install_pyinstaller():
     """Install PyInstaller for building executables"""
-    print("📦 Installing PyInstaller...")
-    return run_command("pip install pyinstaller")
-
-
-def build_executable():
-    """Build the standalone executable"""
-    print("🏗️  Building standalone executable...")
-    
-    # PyInstaller command for creating a single executable file
-    cmd = [
-        "pyinstaller",
-        "--onefile",                    # Single executable file
-        "--name=ubik",                  # Executable name
-      # "--target-architecture=universal2",  # Build for both ARM and Intel
-        "--add-data=ubik_tools.py:.",   # Include ubik_tools.py
-        "--hidden-import=agno.models.openai",
-        "--hidden-import=composio_agno",
-        "--hidden-import=agno.tools.mcp", 
-        "--hidden-import=mcp", 
-        "--hidden-import=agno.team.team",
-        "--hidden-import=agno.agent",
-        "--collect-all=agno",
-        "--collect-all=composio_agno",
-        "--collect-all=openai",
-        "--collect-all=mcp",
-        "--collect-all=pydantic",
-        "--clean",                      # Clean build cache
-        "--noconfirm",                  # Overwrite without asking
-        "ubik.py"
-    ]
-    
-    return run_command(" ".join(cmd))
-
-
-def optimize_build():
-    """Optimize the build by excluding unnecessary modules"""
-    print("⚡ Optimizing build size...")
-    
-    # Create a more optimized build
-    cmd = [
-        "pyinstaller",
-        "--onefile",
-        "--name=ubik",
-        "--exclude-module=matplotlib",
-        "--exclude-module=numpy", 
-        "--exclude-module=pandas",
-        "--exclude-module=scipy",
-        "--exclude-module=torch",
-        "--exclude-module=tensorflow",
-        "--exclude-module=jupyter",
-        "--exclude-module=notebook",
-        "--exclude-module=IPython",
-        "--exclude-module=tkinter",
-        "--exclude-module=PIL",
-        "--hidden-import=agno.models.openai",
-        "--hidden-import=composio_agno",
-        "--hidden-import=agno.tools.mcp",
-        "--hidden-import=mcp",
-        "--hidden-import=sqlalchemy",
-        "--hidden-import=agno.team.team", 
-        "--hidden-import=agno.agent",
-        "--collect-submodules=agno",
-        "--collect-submodules=composio_agno",
-        "--clean",
-        "--noconfirm",
-        "ubik.py"
-    ]
-    
-    return run_command(" ".join(cmd))
-
-
-def create_spec_file():
-    """Create a custom .spec file for more control"""
-    spec_content = '''
-# -*- mode: python ; coding: utf-8 -*-
-
-block_cipher = None
+    if importlib.util.find_spec("PyInstaller"):
+        print("✅ PyInstaller already installed")
+        return True
 
-a = Analysis(
-    ['ubik.py'],
-    pathex=[],
-    binaries=[],
-    datas=[('ubik_tools.py', '.')],
-    hiddenimports=[
-        'agno.models.openai',
-        'composio_agno', 
-        'agno.tools.mcp',
-        'agno.team.team',
-        'agno.agent',
-        'openai',
-        'mcp',
-        'pydantic',
-        'python_dotenv',
-        'sqlalchemy'
-    ],
-    hookspath=[],
-    hooksconfig={},
-    runtime_hooks=[],
-    excludes=[
-        'matplotlib', 'numpy', 'pandas', 'scipy', 
-        'torch', 'tensorflow', 'jupyter', 'notebook',
-        'IPython', 'tkinter', 'PIL', 'cv2'
-    ],
-    win_no_prefer_redirects=False,
-    win_private_assemblies=False,
-    cipher=block_cipher,
-    noarchive=False,
-)
+    print("📦 Installing PyInstaller...")
+    return run_command([sys.executable, "-m", "pip", "install",
+                        f"--cache-dir={PIP_CACHE_DIR}", "pyinstaller"])
 
-pyz = PYZ(a.pure, a.zipped_data, cipher=block_cipher)
 
-exe = EXE(
-    pyz,
-    a.scripts,
-    a.binaries,
-    a.zipfiles,
-    a.datas,
-    [],
-    name='ubik',
-    debug=False,
-    bootloader_ignore_signals=False,
-    strip=False,
-    upx=True,
-    upx_exclude=[],
-    runtime_tmpdir=None,
-    console=True,
-    disable_windowed_traceback=False,
-    argv_emulation=False,
-    target_arch=None,
-    codesign_identity=None,
-    entitlements_file=None,
-)
-'''
-    
-    with open('ubik.spec', 'w') as f:
-        f.write(spec_content)
-    
-    print("📄 Created custom ubik.spec file")
-    return True
+# Checked-in PyInstaller spec; edit it directly to change the build
+SPEC_FILE = "ubik.spec"
 
 
-def build_from_spec():
+def purge_pycache():
+    """Remove cached bytecode of installed packages so it is recompiled at -O"""
+    # Inside a venv everything under sys.prefix is ours; otherwise only touch
+    # site-packages, never the interpreter's own (often root-owned) stdlib
+    if sys.prefix != sys.base_prefix:
+        roots = [Path(sys.prefix)]
+    else:
+        roots = [Path(p) for p in site.getsitepackages() + [site.getusersitepackages()]]
+
+    print("🧹 Purging cached bytecode...")
+    for root in roots:
+        if not root.is_dir():
+            continue
+        for pyc in root.rglob("*.pyc"):
+            try:
+                pyc.unlink()
+            except OSError:
+                pass
+        for cache_dir in root.rglob("__pycache__"):
+            shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+def build_from_spec(fresh: bool = False, debug: bool = False):
     """Build using the custom spec file"""
     print("🔨 Building from spec file...")
-    return run_command("pyinstaller ubik.spec")
+    # Bundle bytecode without asserts; level 2 would also strip docstrings,
+    # which agno turns into the tool descriptions sent to the model
+    env = os.environ.copy()
+    env["PYTHONOPTIMIZE"] = "1"
+
+    # Run PyInstaller from this interpreter, the one it was checked and installed for
+    cmd = [sys.executable, "-m", "PyInstaller", "--noconfirm"]
+    if fresh:
+        cmd.append("--clean")
+    if debug:
+        cmd.append("--log-level=DEBUG")
+    cmd.append(SPEC_FILE)
+    return run_command(cmd, env=env)
 
 
 def check_dependencies():
@@ -191,6 +103,11 @@ def check_dependencies():
 
 def main():
     """Main build function"""
+    parser = argparse.ArgumentParser(description="Build the standalone Ubik AI executable")
+    parser.add_argument("--fresh", action="store_true",
+                        help="Discard PyInstaller's cached analysis and rebuild from scratch")
+    args = parser.parse_args()
+
     print("🚀 Ubik AI Standalone Build Script")
     print("=" * 50)
     
@@ -203,6 +120,14 @@ def main():
         print("❌ ubik_tools.py not found!")
         sys.exit(1)
     
+    if not os.path.exists(SPEC_FILE):
+        print(f"❌ {SPEC_FILE} not found!")
+        sys.exit(1)
+    
+    # Anything installed next to the app gets traced into the bundle
+    if sys.prefix == sys.base_prefix:
+        print("⚠️  Not running inside a virtual environment; build in a venv containing only requirements.txt for a smaller executable")
+
     # Check dependencies
     if not check_dependencies():
         print("❌ Please install dependencies first")
@@ -213,26 +138,22 @@ def main():
         print("❌ Failed to install PyInstaller")
         sys.exit(1)
     
-    # Method 1: Try optimized build first
-    print("\n🎯 Attempting optimized build...")
-    if optimize_build():
-        print("✅ Optimized build successful!")
+    # Stale bytecode would be frozen as-is instead of at PYTHONOPTIMIZE=1
+    if args.fresh:
+        purge_pycache()
+
+    # Single spec-driven build from the checked-in ubik.spec
+    print("\n🎯 Building from spec...")
+    if build_from_spec(args.fresh):
+        print("✅ Spec file build successful!")
     else:
-        print("⚠️  Optimized build failed, trying spec file method...")
-        
-        # Method 2: Use custom spec file
-        if create_spec_file() and build_from_spec():
+        print("⚠️  Build failed, re-running with debug logging...")
+        if build_from_spec(args.fresh, debug=True):
             print("✅ Spec file build successful!")
         else:
-            print("⚠️  Spec file build failed, trying basic build...")
-            
-            # Method 3: Basic build
-            if build_executable():
-                print("✅ Basic build successful!")
-            else:
-                print("❌ All build methods failed")
-                sys.exit(1)
-    
+            print("❌ Build failed")
+            sys.exit(1)
+
     # Check if executable was created
     dist_path = Path("dist")
     if sys.platform.startswith('win'):
@@ -247,7 +168,7 @@ def main():
         
         # Test the executable
         print("\n🧪 Testing executable...")
-        test_cmd = f'"{exe_path}" --list_apps --composio_api_key=test'
+        test_cmd = [str(exe_path), "--list_apps", "--composio_api_key=test"]
         if run_command(test_cmd):
             print("✅ Executable test passed!")
         else:
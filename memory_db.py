@@ -0,0 +1,92 @@
+"""
+Write-behind memory database for Ubik AI.
+Memory writes are queued and applied by a background thread so agent runs never wait on SQLite.
+"""
+import atexit
+import queue
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from agno.memory.v2.db.schema import MemoryRow
+from agno.memory.v2.db.sqlite import SqliteMemoryDb
+
+
+class WriteBehindMemoryDb(SqliteMemoryDb):
+    """SqliteMemoryDb that applies upserts and deletes in background batches
+
+    Pending writes are flushed before every read and at exit, so readers always
+    see their own writes.
+    """
+
+    def __init__(self, *args, batch_size: int = 50, flush_interval: float = 0.1, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: "queue.Queue[Tuple[str, str, Optional[MemoryRow]]]" = queue.Queue()
+        self._writer = threading.Thread(target=self._drain, name="ubik-memory-writer", daemon=True)
+        self._writer.start()
+        atexit.register(self.flush)
+
+    def upsert_memory(self, memory: MemoryRow, create_and_retry: bool = True) -> None:
+        # SqliteMemoryDb retries through this method after creating the table
+        if threading.current_thread() is self._writer:
+            return super().upsert_memory(memory, create_and_retry=create_and_retry)
+        self._queue.put(("upsert", memory.id, memory))
+
+    def delete_memory(self, memory_id: str) -> None:
+        self._queue.put(("delete", memory_id, None))
+
+    def flush(self) -> None:
+        """Wait until every queued write has been applied"""
+        if self._writer.is_alive():
+            self._queue.join()
+
+    def memory_exists(self, memory: MemoryRow) -> bool:
+        self.flush()
+        return super().memory_exists(memory)
+
+    def read_memories(
+        self, user_id: Optional[str] = None, limit: Optional[int] = None, sort: Optional[str] = None
+    ) -> List[MemoryRow]:
+        self.flush()
+        return super().read_memories(user_id=user_id, limit=limit, sort=sort)
+
+    def clear(self) -> bool:
+        self.flush()
+        return super().clear()
+
+    def drop_table(self) -> None:
+        self.flush()
+        super().drop_table()
+
+    def _drain(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            # Only the last write to each memory in a batch matters
+            latest: Dict[str, Tuple[str, Optional[MemoryRow]]] = {}
+            for op, memory_id, memory in batch:
+                latest.pop(memory_id, None)
+                latest[memory_id] = (op, memory)
+
+            for memory_id, (op, memory) in latest.items():
+                try:
+                    if op == "upsert":
+                        super().upsert_memory(memory)
+                    else:
+                        super().delete_memory(memory_id)
+                except Exception as e:
+                    print(f"⚠️  Failed to save memory: {e}")
+
+            for _ in batch:
+                self._queue.task_done()
@@ -7,7 +7,15 @@ echo =============================
 REM Check if Python is installed
 python --version >nul 2>&1
 if %errorlevel% neq 0 (
-    echo ❌ Python is not installed. Please install Python 3.8+ from https://python.org
+    echo ❌ Python is not installed. Please install Python 3.9+ from https://python.org
+    pause
+    exit /b 1
+)
+
+REM asyncio.to_thread needs Python 3.9
+python -c "import sys; sys.exit(sys.version_info < (3, 9))"
+if %errorlevel% neq 0 (
+    echo ❌ Python 3.9+ is required. Please install it from https://python.org
     pause
     exit /b 1
 )
@@ -8,7 +8,13 @@ echo "============================="
 
 # Check if Python is installed
 if ! command -v python3 &> /dev/null; then
-    echo "❌ Python 3 is not installed. Please install Python 3.8+ first."
+    echo "❌ Python 3 is not installed. Please install Python 3.9+ first."
+    exit 1
+fi
+
+# asyncio.to_thread needs Python 3.9
+if ! python3 -c 'import sys; sys.exit(sys.version_info < (3, 9))'; then
+    echo "❌ Python 3.9+ is required, found $(python3 --version)."
     exit 1
 fi
 
@@ -1,64 +1,125 @@
 import re
-import json
 import asyncio
-import hashlib
-import sys
-from typing import Dict, Any, List, Tuple
+import functools
+from collections import OrderedDict
+from typing import Dict, Any, List, Set, Tuple, Union
 
+# orjson parses small payloads several times faster; both raise ValueError
 try:
-    from agno.models.openai import OpenAIChat
-    from agno.agent import Agent
-    from composio_agno import ComposioToolSet, Action
-    from agno.team.team import Team
-    from agno.tools.mcp import MCPTools
-except ImportError as e:
-    print(f"❌ Missing dependencies: {e}")
-    print("Please install required packages:")
-    print("pip install agno composio-agno openai mcp")
-    sys.exit(1)
-
-# Global cache and lock
-_selector_cache = {}
-_cache_lock = asyncio.Lock()
-
-# Precompiled regex patterns for rule-based matching
+    import orjson
+    loads = orjson.loads
+except ImportError:
+    import json
+    loads = json.loads
+
+# Global LRU cache; asyncio runs on one thread and dict ops are atomic, so no lock
+_CACHE_MAX = 4096
+# Values are results, or Tasks for requests still waiting on the LLM
+_selector_cache: "OrderedDict[str, Union[Dict[str, Any], asyncio.Task]]" = OrderedDict()
+# In-flight LLM tasks; the loop only holds weak references to tasks
+_selector_tasks = set()
+
+# Regex patterns for rule-based matching. They are fused into one regex and
+# scanned once, left to right, so no two rules may match at the same place:
+# patterns use non-capturing groups, have no trailing wildcards, and phrases
+# fully covered by a keyword rule (e.g. "what's on my calendar") are left to it.
+# Each rule also lists trigger words, at least one of which appears as a whole
+# word in any request the pattern matches
 RULE_PATTERNS = [
     # Gmail patterns
-    (r"^\s*(check|read|show|get|view) (my )?(email|emails|gmail|inbox|messages)\b", ["gmail"], False),
-    (r"\b(unread|new) emails?\b", ["gmail"], False),
+    (r"^\s*(?:check|read|show|get|view) (?:my )?(?:email|emails|gmail|inbox|messages)\b", ["gmail"], False,
+     {"email", "emails", "gmail", "inbox", "messages"}),
+    (r"\b(?:unread|new) emails?\b", ["gmail"], False,
+     {"email", "emails"}),
     
     # Calendar patterns
-    (r"\b(calendar|schedule|agenda|appointments?|events?|meetings?)\b", ["googlecalendar"], False),
-    (r"\bwhat('?s| is) on (my )?(calendar|schedule)", ["googlecalendar"], False),
-    (r"\b(add|create|schedule) (a )?(event|meeting|appointment)\b", ["googlecalendar"], False),
+    (r"\b(?:calendar|schedule|agenda|appointments?|events?|meetings?)\b", ["googlecalendar"], False,
+     {"calendar", "schedule", "agenda", "appointment", "appointments",
+      "event", "events", "meeting", "meetings"}),
     
     # Weather patterns
-    (r"\b(weather|forecast|temperature|humidity|rain|snow|wind|sunny)\b", ["weather"], False),
-    (r"\bhow is the weather (in )?.*", ["weather"], False),
+    (r"\b(?:weather|forecast|temperature|humidity|rain|snow|wind|sunny)\b", ["weather"], False,
+     {"weather", "forecast", "temperature", "humidity", "rain", "snow", "wind", "sunny"}),
     
     # Search patterns
-    (r"\b(search|find|look up|research|google|web) (for )?.*", ["composio_search"], False),
-    (r"\b(who is|what is|where is) .*", ["composio_search"], False),
+    (r"\b(?:search|find|look up|research|google|web) ", ["composio_search"], False,
+     {"search", "find", "look", "research", "google", "web"}),
+    (r"\b(?:who is|what is|where is) ", ["composio_search"], False,
+     {"who", "what", "where"}),
     
-    # Drive patterns
-    (r"\b(drive|document|spreadsheet|doc|sheet|presentation|slide)\b", ["googledrive"], False),
-    (r"\b(open|create|edit|share) (a )?(doc|document|sheet|spreadsheet)\b", ["googledrive"], False),
+    # Drive patterns ("document" is also a filesystem trigger)
+    (r"\b(?:drive|spreadsheet|doc|sheet|presentation|slide)\b", ["googledrive"], False,
+     {"drive", "spreadsheet", "doc", "sheet", "presentation", "slide"}),
+    (r"\bdocument\b", ["googledrive"], True,
+     {"document"}),
     
     # Maps patterns
-    (r"\b(map|maps|location|route|directions|navigate|distance)\b", ["google_maps"], False),
-    (r"\bhow (to|do I) get to .*", ["google_maps"], False),
+    (r"\b(?:map|maps|location|route|directions|navigate|distance)\b", ["google_maps"], False,
+     {"map", "maps", "location", "route", "directions", "navigate", "distance"}),
+    (r"\bhow (?:to|do I) get to ", ["google_maps"], False,
+     {"get"}),
     
     # Slack patterns
-    (r"\b(slack|message|chat|channel|workspace|dm|direct message)\b", ["slack"], False),
-    (r"\b(send|post) (a )?(message|notification) (in|to) .*", ["slack"], False),
+    (r"\b(?:slack|message|chat|channel|workspace|dm|direct message)\b", ["slack"], False,
+     {"slack", "message", "chat", "channel", "workspace", "dm"}),
+    (r"\b(?:send|post) (?:a )?(?:message|notification) (?:in|to) ", ["slack"], False,
+     {"message", "notification"}),
     
     # Filesystem triggers
-    (r"\b(file|files|folder|directory|document|save|store|download|upload|attach)\b", [], True),
+    (r"\b(?:file|files|folder|directory|save|store|download|upload|attach)\b", [], True,
+     {"file", "files", "folder", "directory", "save", "store", "download", "upload", "attach"}),
 ]
 
-# Precompiled regex objects
-COMPILED_RULES = [(re.compile(pattern, re.IGNORECASE), agents, fs) 
-                  for pattern, agents, fs in RULE_PATTERNS]
+@functools.lru_cache(maxsize=256)
+def _fused_rules(indices: Tuple[int, ...]) -> "re.Pattern[str]":
+    """Fuse the given rules into a single alternation of named groups
+    
+    The shared leading \\b is factored out so most positions are rejected
+    immediately.
+    """
+    anchored = [f"(?P<r{i}>{RULE_PATTERNS[i][0]})" for i in indices
+                if not RULE_PATTERNS[i][0].startswith(r"\b")]
+    words = [f"(?P<r{i}>{RULE_PATTERNS[i][0][2:]})" for i in indices
+             if RULE_PATTERNS[i][0].startswith(r"\b")]
+    if words:
+        anchored.append(r"\b(?:" + "|".join(words) + ")")
+    return re.compile("|".join(anchored), re.IGNORECASE)
+
+MEGA_RE = _fused_rules(tuple(range(len(RULE_PATTERNS))))
+GROUP_TO_AGENTS = {f"r{i}": (agents, fs) for i, (_, agents, fs, _) in enumerate(RULE_PATTERNS)}
+
+# Keyword pre-filter: trigger word -> indices of the rules it can enable
+ALL_TRIGGER_WORDS = frozenset().union(*(triggers for _, _, _, triggers in RULE_PATTERNS))
+TRIGGER_TO_RULES = {word: tuple(i for i, (_, _, _, triggers) in enumerate(RULE_PATTERNS)
+                                if word in triggers)
+                    for word in ALL_TRIGGER_WORDS}
+# Words as delimited by \b, so a trigger word is a token exactly when it
+# appears as a whole word
+_TOKEN_RE = re.compile(r"\w+")
+# Characters that re.IGNORECASE matches to an ASCII letter but str.lower() doesn't map to it
+_ASCII_FOLD = str.maketrans({"İ": "i", "ı": "i", "ſ": "s"})
+
+def _is_keyword_rule(pattern: str, triggers) -> bool:
+    """Whether a rule is a plain word list matching exactly its trigger words"""
+    match = re.fullmatch(r"\\b(\(\?:[a-z?| ]+\)|[a-z]+)\\b", pattern)
+    return match is not None and all(re.fullmatch(match.group(1), word) for word in triggers)
+
+KEYWORD_RULES = frozenset(i for i, (pattern, _, _, triggers) in enumerate(RULE_PATTERNS)
+                          if _is_keyword_rule(pattern, triggers))
+
+def _keyword_dispatch(words) -> Union[Tuple[Tuple[str, ...], bool], None]:
+    """Selector output for a set of trigger words, if it only enables keyword rules"""
+    rules = {i for word in words for i in TRIGGER_TO_RULES[word]}
+    if not rules <= KEYWORD_RULES:
+        return None
+    agents = sorted({agent for i in rules for agent in RULE_PATTERNS[i][1]})
+    return tuple(agents), any(RULE_PATTERNS[i][2] for i in rules)
+
+# Each rule hit adds 1 to the confidence score; anchored rules (starting with
+# ^) are specific enough to be trusted on their own
+RULE_CONFIDENCE_THRESHOLD = 2
+HIGH_CONFIDENCE_GROUPS = frozenset(f"r{i}" for i, (pattern, _, _, _) in enumerate(RULE_PATTERNS)
+                                   if pattern.startswith("^"))
 
 # Common requests for pre-caching
 COMMON_REQUESTS = [
@@ -74,21 +135,52 @@ COMMON_REQUESTS = [
     "download the file"
 ]
 
-def rule_based_selector(user_request: str) -> Tuple[List[str], bool]:
-    """Ultra-fast rule-based selector with pattern matching"""
-    request_lower = user_request.lower()
+# Precomputed output for the trigger-word sets of single keywords and the
+# common requests. Keyword rules never overlap, so each trigger word in the
+# request is exactly one match and confidence is the trigger word count
+FAST_TABLE: Dict[frozenset, Tuple[Tuple[str, ...], bool]] = {}
+for _words in [frozenset()] + [frozenset([word]) for word in ALL_TRIGGER_WORDS] + [
+        ALL_TRIGGER_WORDS.intersection(_TOKEN_RE.findall(req.lower())) for req in COMMON_REQUESTS]:
+    _entry = _keyword_dispatch(_words)
+    if _entry is not None:
+        FAST_TABLE[_words] = _entry
+
+def rule_based_selector(user_request: str) -> Tuple[List[str], bool, int]:
+    """Ultra-fast rule-based selector with pattern matching
+    
+    Returns the matched agents, whether the filesystem is needed, and a
+    confidence score (see RULE_CONFIDENCE_THRESHOLD).
+    """
     agents = set()
     needs_filesystem = False
+    confidence = 0
+    
+    tokens = _TOKEN_RE.findall(user_request.translate(_ASCII_FOLD).lower())
+    hits = [token for token in tokens if token in ALL_TRIGGER_WORDS]
+    words = frozenset(hits)
     
-    # Apply all regex rules
-    for pattern, pattern_agents, pattern_fs in COMPILED_RULES:
-        if pattern.search(request_lower):
-            for agent in pattern_agents:
-                agents.add(agent)
-            if pattern_fs:
-                needs_filesystem = True
+    # Known keyword combinations are answered without running any regex
+    fast = FAST_TABLE.get(words)
+    if fast is not None:
+        agents.update(fast[0])
+        needs_filesystem = fast[1]
+        confidence = len(hits)
+    else:
+        # Only rules whose trigger words appear in the request can match;
+        # apply them in one pass. Patterns are case-insensitive so match the
+        # raw request
+        candidates = {i for word in words for i in TRIGGER_TO_RULES[word]}
+        for match in _fused_rules(tuple(sorted(candidates))).finditer(user_request):
+            pattern_agents, pattern_fs = GROUP_TO_AGENTS[match.lastgroup]
+            agents.update(pattern_agents)
+            needs_filesystem |= pattern_fs
+            if match.lastgroup in HIGH_CONFIDENCE_GROUPS:
+                confidence += RULE_CONFIDENCE_THRESHOLD
+            else:
+                confidence += 1
     
     # Contextual overrides
+    request_lower = user_request.lower()
     if "search" in request_lower and "save" in request_lower:
         agents.add("composio_search")
         needs_filesystem = True
@@ -96,73 +188,171 @@ def rule_based_selector(user_request: str) -> Tuple[List[str], bool]:
     if "weather" in agents and ("map" in request_lower or "directions" in request_lower):
         agents.add("google_maps")
     
-    return list(agents), needs_filesystem
+    return list(agents), needs_filesystem, confidence
 
-async def llm_based_selector(user_request: str, model) -> Dict[str, Any]:
-    """Optimized LLM-based selector with caching and timeouts"""
-    # Generate request signature for caching
-    request_hash = hashlib.sha256(user_request.encode()).hexdigest()
-    
-    # Check cache
-    async with _cache_lock:
-        if request_hash in _selector_cache:
-            return _selector_cache[request_hash]
-    
-    # Optimized prompt for speed
-    prompt = (
-        "Available agents: gmail,googlecalendar,weather,composio_search,"
-        "googledrive,google_maps,slack,filesystem\n"
-        "Respond ONLY with JSON. Example: "
-        '{"agents":["gmail"],"needs_filesystem":false}\n'
-        f"Request: {user_request}"
-    )
+def trigger_agents(user_request: str) -> Set[str]:
+    """Every agent that some trigger word in the request points at
+    
+    A request whose trigger words point at agents the rules didn't select is
+    ambiguous (e.g. "emails" without "unread"/"new").
+    """
+    words = ALL_TRIGGER_WORDS.intersection(_TOKEN_RE.findall(user_request.translate(_ASCII_FOLD).lower()))
+    return {agent for word in words for i in TRIGGER_TO_RULES[word] for agent in RULE_PATTERNS[i][1]}
+
+# Optimized prompt for speed; the request itself is sent as the run message
+SELECTOR_INSTRUCTIONS = (
+    "Available agents: gmail,googlecalendar,weather,composio_search,"
+    "googledrive,google_maps,slack,filesystem\n"
+    "Respond ONLY with JSON. Example: "
+    '{"agents":["gmail"],"needs_filesystem":false}'
+)
+
+# Idle selector agents per model, reused across calls. An Agent holds per-run
+# state, so concurrent calls each check out their own instance
+_selector_agents: Dict[int, List[Any]] = {}
+
+def _acquire_selector_agent(model):
+    """Take an idle selector agent for this model, creating one if needed"""
+    # Imported here so rule-based selection never pays for loading agno
+    from agno.agent import Agent
+    
+    pool = _selector_agents.setdefault(id(model), [])
+    if pool:
+        return pool.pop()
     
     # Create agent with optimized settings
-    selector = Agent(
+    return Agent(
         name="Hybrid_Selector_LLM",
         model=model,
-        instructions=[prompt],
+        instructions=[SELECTOR_INSTRUCTIONS],
         # max_tokens=80,
         # temperature=0.0,
         # response_format={"type": "json_object"}
         # format=
     )
+
+def _release_selector_agent(model, selector) -> None:
+    """Return a selector agent to its model's pool"""
+    _selector_agents[id(model)].append(selector)
+
+# Per-attempt LLM timeouts: a quick first try, then one more patient retry
+_LLM_TIMEOUTS = (0.8, 2.5)
+
+async def _query_llm_selector(user_request: str, model) -> Dict[str, Any]:
+    """Ask the LLM which agents a request needs, falling back to rules
+    
+    The result's "source" is "llm" or "rule", depending on which answered.
+    """
+    selector = _acquire_selector_agent(model)
     
     # Execute with timeout
     try:
-        response = await asyncio.wait_for(
-            selector.arun(prompt),
-            timeout=1.0  # Aggressive timeout
-        )
-        result = json.loads(response.content.strip())
-    except (asyncio.TimeoutError, json.JSONDecodeError):
-        # Fallback to rule-based if LLM fails
-        agents, needs_fs = rule_based_selector(user_request)
-        result = {"agents": agents or ["composio_search"], 
-                 "needs_filesystem": needs_fs}
-    
-    # Update cache
-    async with _cache_lock:
-        _selector_cache[request_hash] = result
-        
+        for timeout in _LLM_TIMEOUTS:
+            try:
+                response = await asyncio.wait_for(selector.arun(user_request), timeout=timeout)
+            except asyncio.TimeoutError:
+                continue
+            result = loads(response.content)
+            if not isinstance(result, dict):
+                raise ValueError("selector response is not a JSON object")
+            result["source"] = "llm"
+            return result
+    except ValueError:
+        pass
+    finally:
+        _release_selector_agent(model, selector)
+    
+    # Fallback to rule-based if LLM fails
+    agents, needs_fs, _ = rule_based_selector(user_request)
+    return {"agents": agents or ["composio_search"], 
+            "needs_filesystem": needs_fs,
+            "source": "rule"}
+
+async def llm_based_selector(user_request: str, model) -> Dict[str, Any]:
+    """Optimized LLM-based selector with caching and timeouts"""
+    # The request string itself is the cache key; no need to hash it
+    request_hash = user_request
+    
+    # Check cache; a Task means an identical request is already waiting on
+    # the LLM, so share its result instead of making a second call
+    cached = _selector_cache.get(request_hash)
+    if cached is None:
+        # Claim the cache slot, evicting the least recently used entry when full.
+        # The LLM call runs in its own task so one caller's cancellation can't
+        # abort it for the others
+        cached = asyncio.ensure_future(_resolve_selection(request_hash, user_request, model))
+        _selector_cache[request_hash] = cached
+        if len(_selector_cache) > _CACHE_MAX:
+            _selector_cache.popitem(last=False)
+        _selector_tasks.add(cached)
+        cached.add_done_callback(_forget_selection_task)
+    else:
+        _selector_cache.move_to_end(request_hash)
+    
+    if isinstance(cached, asyncio.Future):
+        return await asyncio.shield(cached)
+    return cached
+
+async def _resolve_selection(request_hash: str, user_request: str, model) -> Dict[str, Any]:
+    """Query the LLM for a cache slot, then store or drop the slot's result"""
+    task = asyncio.current_task()
+    try:
+        result = await _query_llm_selector(user_request, model)
+    except BaseException:
+        # Drop the slot so a retry calls the LLM again
+        if _selector_cache.get(request_hash) is task:
+            del _selector_cache[request_hash]
+        raise
+    
+    # Only cache LLM answers; after a fallback the next identical request
+    # should try the LLM again
+    if _selector_cache.get(request_hash) is task:
+        if result["source"] == "llm":
+            _selector_cache[request_hash] = result
+        else:
+            del _selector_cache[request_hash]
     return result
 
+def _forget_selection_task(task: asyncio.Task) -> None:
+    """Release a finished LLM task, consuming its error if every caller left"""
+    _selector_tasks.discard(task)
+    if not task.cancelled():
+        task.exception()
+
 async def smart_agent_selector(user_request: str, model) -> Dict[str, Any]:
     """Hybrid agent selector with rule-based priority"""
     # First try ultra-fast rule-based approach
-    agents, needs_fs = rule_based_selector(user_request)
+    agents, needs_fs, confidence = rule_based_selector(user_request)
     
-    # If rule-based found agents and request is simple, use it
-    if agents and len(user_request.split()) <= 7:
-        return {"agents": agents, "needs_filesystem": needs_fs}
+    # If rule-based found agents with confidence, or the request is simple, use it
+    if agents and (confidence >= RULE_CONFIDENCE_THRESHOLD or len(user_request.split()) <= 7):
+        return {"agents": agents, "needs_filesystem": needs_fs, "source": "rule"}
     
     # Otherwise use optimized LLM with caching
     return await llm_based_selector(user_request, model)
 
-async def warmup_cache(model):
-    """Pre-cache common requests during initialization"""
-    warmup_tasks = [smart_agent_selector(req, model) for req in COMMON_REQUESTS]
-    await asyncio.gather(*warmup_tasks, return_exceptions=True)
+# Max warmup selections in flight, to stay clear of LLM rate limits
+_WARMUP_CONCURRENCY = 3
+# Keep a reference so the background warmup isn't garbage collected
+_warmup_task = None
+
+async def warmup_cache(model, wait: bool = False):
+    """Pre-cache common requests in the background during initialization
+    
+    Returns immediately unless wait is True.
+    """
+    global _warmup_task
+    sem = asyncio.Semaphore(_WARMUP_CONCURRENCY)
+    
+    async def _one(req: str):
+        async with sem:
+            await smart_agent_selector(req, model)
+    
+    # gather() schedules every selection as a task right away
+    _warmup_task = asyncio.gather(*(_one(req) for req in COMMON_REQUESTS),
+                                  return_exceptions=True)
+    if wait:
+        await _warmup_task
 
 # Initialize with fast model during app startup
-# asyncio.run(warmup_cache("gpt-3.5-turbo"))
\ No newline at end of file
+# asyncio.run(warmup_cache("gpt-3.5-turbo", wait=True))
\ No newline at end of file
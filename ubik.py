@@ -3,60 +3,236 @@
 Ubik AI - Standalone CLI App
 A simple AI assistant that connects to your Gmail, Calendar, Drive, Slack and more.
 """
+from __future__ import annotations
+
 import asyncio
 import argparse
+import functools
 import os
+import re
 import sys
-import json
-from typing import Dict, Any, List, Optional
-
-from mcp import StdioServerParameters
-from ubik_tools import gmail_tools_actions, calendar_tools_actions, \
-    googledrive_tools_actions, weather_tools_actions, websearch_tools_actions, \
-    google_maps_tools_actions, slack_tools_actions
+import threading
+import time
+import uuid
+from contextlib import AsyncExitStack
+from typing import TYPE_CHECKING, Callable, Dict, Any, List, Optional, Tuple
 
-try:
+# agno, composio, mcp and sqlalchemy take a long time to import, so they are
+# imported where they're used; --list_apps never loads them
+if TYPE_CHECKING:
     from agno.models.openai import OpenAIChat
     from agno.agent import Agent
-    from composio_agno import ComposioToolSet, Action
+    from composio_agno import ComposioToolSet
     from agno.team.team import Team
     from agno.tools.mcp import MCPTools
     from agno.memory.v2.memory import Memory
-    from agno.memory.v2.db.sqlite import SqliteMemoryDb
     from agno.storage.sqlite import SqliteStorage
-except ImportError as e:
-    print(f"❌ Missing dependencies: {e}")
-    print("Please install required packages:")
-    print("pip install agno composio-agno openai mcp")
-    sys.exit(1)
 
+from smart_agent_selector import RULE_CONFIDENCE_THRESHOLD, loads, rule_based_selector, trigger_agents
 
-# from smart_agent_selector import smart_agent_selector
+# Apps holding the user's files in the cloud; with these, words like "folder" or
+# "document" don't mean the local filesystem
+_CLOUD_AGENTS = frozenset(("gmail", "googlecalendar", "googledrive", "slack"))
 
-# Tool actions mapping
-TOOL_ACTIONS = {
-    "gmail": gmail_tools_actions,
-    "googlecalendar": calendar_tools_actions,
-    "googledrive": googledrive_tools_actions,
-    "slack": slack_tools_actions,
-    "weathermap": weather_tools_actions,
-    "composio_search": websearch_tools_actions,
-    "google_maps": google_maps_tools_actions,
-}
+# Tool actions mapping (frozen; the action sets never change at runtime).
+# Built on first use because ubik_tools imports composio
+@functools.lru_cache(maxsize=1)
+def get_tool_actions() -> Dict[str, tuple]:
+    """Get the Composio actions for each app"""
+    from ubik_tools import gmail_tools_actions, calendar_tools_actions, \
+        googledrive_tools_actions, weather_tools_actions, websearch_tools_actions, \
+        google_maps_tools_actions, slack_tools_actions
+    return {
+        "gmail": tuple(gmail_tools_actions),
+        "googlecalendar": tuple(calendar_tools_actions),
+        "googledrive": tuple(googledrive_tools_actions),
+        "slack": tuple(slack_tools_actions),
+        "weathermap": tuple(weather_tools_actions),
+        "composio_search": tuple(websearch_tools_actions),
+        "google_maps": tuple(google_maps_tools_actions),
+    }
 
 # Apps that need OAuth
 OAUTH_APPS = ["gmail", "googlecalendar", "googledrive", "slack", 'google_maps']
 NO_AUTH_APPS = ["weathermap", "composio_search"]
+# Connection statuses (lowercase) that mean an app is usable
+_ACTIVE_STATUSES = frozenset(('active', 'connected'))
+
+# The agents list of a partially streamed selector answer
+_AGENTS_LIST_RE = re.compile(r'"agents"\s*:\s*(\[[^\]]*\])')
+# Requests joining several asks ("email and weather") with nothing passed between them
+_CONJUNCTION_RE = re.compile(r"\b(?:and|also|plus|as well as)\b|[,;&]", re.IGNORECASE)
+_DEPENDENCY_RE = re.compile(r"\b(?:then|after|afterwards|based on|using|from (?:the|that|it)|them|it)\b", re.IGNORECASE)
+# Agents asked to act usually need another agent's output first ("post the weather to slack")
+_ACTION_RE = re.compile(
+    r"\b(?:send|post|create|save|reply|forward|draft|write|schedule|book|invite|add|update|delete|remove|upload|share|move|rename|copy)(?:s|es|d|ed|ing)?\b",
+    re.IGNORECASE,
+)
+
+# Cached tools are refreshed after this many seconds
+TOOLS_TTL = 300
+# Streamed output is written at most this often, or at the end of a line
+STREAM_FLUSH_INTERVAL = 0.05
+
+# SQLite settings applied to every connection: WAL lets readers run alongside the
+# writer and, with synchronous=NORMAL, commits skip most fsyncs
+_SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA cache_size=-65536",
+)
+
+# Filesystem agent instructions; {home}, {tz} and {now} are filled in per query
+_FS_INSTRUCTIONS_TEMPLATE = (
+    "You're an expert Linux/macOS command-line specialist with DevOps expertise.",
+    "Safety first: NEVER run destructive commands (rm -rf, dd, mv to root, etc.)",
+    "Always create and use the 'Ubik AI' directory in the user's Desktop({home}/Desktop/Ubik AI) as default workspace:",
+    "  1. Check existence: `ls {home}/Desktop/Ubik AI`",
+    "  2. Create if missing: `mkdir -p {home}/Desktop/Ubik AI`",
+    "  3. Use as default path when user doesn't specify location",
+    "default path: ~/Desktop/Ubik AI or /Users/<username>/Desktop/Ubik AI",
+    "NOTE: If user doesn't specify a path, use the default Ubik AI directory on Desktop.",
+    "Professional standards:",
+    "  - Validate paths before operations",
+    "  - Use absolute paths with proper escaping",
+    "  - Confirm disk space before large operations",
+    "  - Preserve permissions and metadata",
+    "Special handling:",
+    "  - For media files: maintain originals, create copies for edits",
+    "  - For code: preserve git history and directory structure",
+    "User experience:",
+    "  - Provide clear progress indicators",
+    "  - Suggest optimizations (e.g., compression for large files)",
+    "  - Estimate time/resources for long operations",
+    "user's current time is: {now}",
+    "user's timezone is: {tz}",
+    "** NOTE: Provide the path to file or folder if needed after completing the operation",
+)
+
+
+# desktop_commander MCP session shared across queries; started on first use because
+# `npx` + Node startup is slow. anyio requires it to be closed from the task that
+# opened it, so close_fs_mcp() is awaited there instead of from an atexit hook
+_fs_mcp_stack: Optional[AsyncExitStack] = None
+_fs_mcp: Optional[MCPTools] = None
+
+
+async def _get_or_create_fs_mcp() -> MCPTools:
+    """Get the shared desktop_commander MCP session, starting it if needed"""
+    global _fs_mcp_stack, _fs_mcp
+    if _fs_mcp is None:
+        from agno.tools.mcp import MCPTools
+        from mcp import StdioServerParameters
+        
+        server_params = StdioServerParameters(
+            command="npx",
+            args=["-y", "@wonderwhy-er/desktop-commander@latest"],
+        )
+        stack = AsyncExitStack()
+        _fs_mcp = await stack.enter_async_context(MCPTools(server_params=server_params))
+        _fs_mcp_stack = stack
+    return _fs_mcp
+
+
+async def close_fs_mcp():
+    """Close the shared desktop_commander MCP session, if it was started"""
+    global _fs_mcp_stack, _fs_mcp
+    stack, _fs_mcp_stack, _fs_mcp = _fs_mcp_stack, None, None
+    if stack is not None:
+        try:
+            await stack.aclose()
+        except Exception as e:
+            print(f"⚠️  Failed to close filesystem session: {e}")
+
+# Team instructions; {home}, {tz} and {now} are filled in per query
+_TEAM_INSTRUCTIONS_TEMPLATE = (
+    "Collaborate to provide comprehensive assistance",
+    "Use tools effectively to fetch and create information",
+    "Provide clear and actionable responses",
+    "Use markdown formatting for better readability",
+    "Use timezone and local currency/units as per the user's location.",
+    "When someone ask about you, tell them you are Ubik AI, a personal assistant that can help with various tasks like checking emails, scheduling events, searching the web(composio_search), and managing files. You're designed to assist users in their daily tasks and provide information quickly and efficiently. You're secure and respect user privacy",
+    "user's timezone is: {tz} if you want to determine user's timezone, use `date` command or locaition information",
+    "user's default directory is: {home}/Desktop/Ubik AI",
+    # "don't ask follow-up questions, just provide the answer",
+    "user's current time is: {now}",
+    "user's timezone is: {tz}",
+)
 
 
 def print_banner():
     """Print app banner"""
-    print("🤖 Ubik AI - Your Personal Assistant")
-    print("=" * 50)
+    sys.stdout.write("🤖 Ubik AI - Your Personal Assistant\n" + "=" * 50 + "\n")
+
 
+# Map agent names to app names
+AGENT_TO_APP = {
+    "gmail": "gmail",
+    "googlecalendar": "googlecalendar",
+    "googledrive": "googledrive",
+    "slack": "slack",
+    "weather": "weathermap",
+    "composio_search": "composio_search"
+}
+
+
+def _complete_json_object(text: str) -> Optional[str]:
+    """Return the first balanced {...} in streamed text, once it has fully arrived"""
+    start = text.find("{")
+    if start < 0:
+        return None
+    depth = 0
+    in_string = escaped = False
+    for i in range(start, len(text)):
+        char = text[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char == "{":
+            depth += 1
+        elif char == "}":
+            depth -= 1
+            if depth == 0:
+                return text[start:i + 1]
+    return None
+
+
+def is_confident_rule_selection(user_request: str, agents: List[str], needs_filesystem: bool, confidence: int) -> bool:
+    """Check if the keyword rules' answer can be trusted without asking the AI
+    
+    The rule table is broad, so only a single agent from a strong or short match
+    is trusted, and never when the request joins several asks, mentions another
+    agent's trigger words, or pairs a cloud app with filesystem words.
+    """
+    if len(agents) != 1:
+        return False
+    if confidence < RULE_CONFIDENCE_THRESHOLD and len(user_request.split()) > 7:
+        return False
+    if _CONJUNCTION_RE.search(user_request) or trigger_agents(user_request) - set(agents):
+        return False
+    return not (needs_filesystem and agents[0] in _CLOUD_AGENTS)
 
-async def smart_agent_selector(user_request: str, model) -> Dict[str, Any]:
-    """AI decides which agents are needed"""
+
+async def smart_agent_selector(user_request: str, model, on_agents: Optional[Callable[[List[str]], None]] = None) -> Dict[str, Any]:
+    """Keyword rules decide obvious requests; AI decides the rest
+
+    on_agents is called with the agent list as soon as the AI has streamed it,
+    before the rest of the answer arrives.
+    """
+    agents, needs_filesystem, confidence = rule_based_selector(user_request)
+    if is_confident_rule_selection(user_request, agents, needs_filesystem, confidence):
+        return {"agents": agents, "needs_filesystem": needs_filesystem}
+    
+    from agno.agent import Agent
+    
     selector = Agent(
         name="Agent Selector",
         model=model,
@@ -74,90 +250,274 @@ async def smart_agent_selector(user_request: str, model) -> Dict[str, Any]:
         ],
     )
     
-    response = await selector.arun(f"Which agents needed for: '{user_request}'")
+    response_stream = await selector.arun(f"Which agents needed for: '{user_request}'", stream=True)
+    
+    chunks = []
+    content = ""
+    agents_seen = False
+    try:
+        async for event in response_stream:
+            if event.event != "RunResponseContent" or not event.content:
+                continue
+            chunks.append(event.content)
+            content = "".join(chunks)
+            
+            # Let the caller start on the agents while needs_filesystem streams in
+            if on_agents is not None and not agents_seen:
+                match = _AGENTS_LIST_RE.search(content)
+                if match:
+                    agents_seen = True
+                    try:
+                        on_agents(loads(match.group(1)))
+                    except (ValueError, TypeError):
+                        pass
+            
+            # Stop reading as soon as the JSON object is complete
+            complete = _complete_json_object(content)
+            if complete is not None:
+                content = complete
+                break
+    finally:
+        # Stopping early must still close the HTTP stream, not leave it to the GC
+        await response_stream.aclose()
     
+    # JSON allows surrounding whitespace, so no strip; empty content raises ValueError too
     try:
-        return json.loads(response.content.strip())
-    except:
+        return loads(content)
+    except ValueError:
         return {"agents": ["search"], "needs_filesystem": False}
 
 
-def check_connections(toolset: ComposioToolSet, entity_id: str, needed_agents: List[str]) -> Dict[str, bool]:
+async def check_connections(toolset: ComposioToolSet, entity_id: str, needed_agents: List[str]) -> Dict[str, bool]:
     """Check which agents have valid connections"""
-    connection_status = {}
+    app_mapping = {
+        "gmail": "gmail",
+        "googlecalendar": "googlecalendar", 
+        "googledrive": "googledrive",
+        "slack": "slack",
+        "google_maps": "google_maps",
+    }
     
+    # One round-trip for all agents, off the event loop
+    active_apps = set()
+    if any(agent_type in OAUTH_APPS for agent_type in needed_agents):
+        try:
+            connections = await asyncio.to_thread(
+                lambda: toolset.get_entity(entity_id).get_connections()
+            )
+            active_apps = {
+                _app_of(conn) for conn in connections
+                if getattr(conn, 'status', '').lower() in _ACTIVE_STATUSES
+            }
+        except Exception:
+            pass
+    
+    connection_status = {}
     for agent_type in needed_agents:
         if agent_type in OAUTH_APPS:
-            try:
-                entity = toolset.get_entity(entity_id)
-                connections = entity.get_connections()
-                
-                app_mapping = {
-                    "gmail": "gmail",
-                    "googlecalendar": "googlecalendar", 
-                    "googledrive": "googledrive",
-                    "slack": "slack",
-                    "google_maps": "google_maps",
-                }
-                
-                app_name = app_mapping.get(agent_type, agent_type)
-                
-                is_connected = any(
-                    getattr(conn, 'appName', '').lower() == app_name.lower() and
-                    getattr(conn, 'status', '').lower() in ['active', 'connected']
-                    for conn in connections
-                )
-                
-                connection_status[agent_type] = is_connected
-                
-            except Exception:
-                connection_status[agent_type] = False
+            connection_status[agent_type] = app_mapping.get(agent_type, agent_type).lower() in active_apps
         else:
             connection_status[agent_type] = True
     
     return connection_status
 
 
+@functools.lru_cache(maxsize=8)
+def get_toolset(api_key: str, entity_id: str) -> ComposioToolSet:
+    """Get the shared toolset (and its HTTP client) for an entity"""
+    from composio_agno import ComposioToolSet
+    
+    return ComposioToolSet(api_key=api_key, entity_id=entity_id)
+
+
+@functools.lru_cache(maxsize=64)
+def _get_tools_cached(api_key: str, entity_id: str, app_name: str, check: bool, ttl_bucket: int):
+    """Fetch the Composio tools for an app once per TTL window"""
+    toolset = get_toolset(api_key, entity_id)
+    actions = list(get_tool_actions()[app_name])
+    if check:
+        return toolset.get_tools(actions=actions, check_connected_accounts=True)
+    return toolset.get_tools(actions=actions)
+
+
+def get_app_tools(api_key: str, entity_id: str, app_name: str):
+    """Fetch the Composio tools for an app (blocking network call on a cache miss)"""
+    return _get_tools_cached(api_key, entity_id, app_name, app_name in OAUTH_APPS, int(time.monotonic() // TOOLS_TTL))
+
+
+# Tool fetches in flight; lru_cache only helps once a fetch has finished
+_tool_fetches: Dict[Tuple[str, str, str], asyncio.Future] = {}
+
+
+def fetch_app_tools(api_key: str, entity_id: str, app_name: str) -> asyncio.Future:
+    """Fetch an app's tools in a thread, joining the fetch already in flight if any
+
+    The task is shared, so await it through asyncio.shield.
+    """
+    key = (api_key, entity_id, app_name)
+    task = _tool_fetches.get(key)
+    if task is None:
+        # Build the shared toolset on the loop: lru_cache doesn't make threads wait
+        # on a miss, so concurrent fetches would each build their own
+        get_toolset(api_key, entity_id)
+        task = asyncio.ensure_future(asyncio.to_thread(get_app_tools, api_key, entity_id, app_name))
+        _tool_fetches[key] = task
+        task.add_done_callback(functools.partial(_forget_tool_fetch, key))
+    return task
+
+
+def _forget_tool_fetch(key: Tuple[str, str, str], task: asyncio.Future):
+    _tool_fetches.pop(key, None)
+    # The fetch may have no waiters left, so retrieve its exception here
+    if not task.cancelled():
+        task.exception()
+
+
+async def print_stream(response_stream, content_event: str):
+    """Print streamed content, batching chunks into fewer writes"""
+    out = getattr(sys.stdout, "buffer", None)
+    if out is None:
+        async for event in response_stream:
+            if event.event == content_event and event.content:
+                sys.stdout.write(event.content)
+        sys.stdout.flush()
+        return
+    
+    encoding = sys.stdout.encoding or "utf-8"
+    # Text already printed must reach the terminal before raw bytes
+    sys.stdout.flush()
+    buf = bytearray()
+    last = time.monotonic()
+    async for event in response_stream:
+        if event.event != content_event or not event.content:
+            continue
+        buf += event.content.encode(encoding, errors="replace")
+        now = time.monotonic()
+        if b"\n" in buf or now - last > STREAM_FLUSH_INTERVAL:
+            out.write(buf)
+            out.flush()
+            buf.clear()
+            last = now
+    out.write(buf)
+    out.flush()
+
+
+async def warmup_tools(api_key: str, entity_id: str):
+    """Prefetch tools for every app into the tools cache, ignoring failures"""
+    await asyncio.gather(
+        *[asyncio.shield(fetch_app_tools(api_key, entity_id, app_name)) for app_name in get_tool_actions()],
+        return_exceptions=True,
+    )
+
+
+def is_independent_request(user_request: str, agent_names: List[str]) -> bool:
+    """Check if each agent can handle its part of the request on its own (read-only asks only)"""
+    return (
+        len(agent_names) >= 2
+        and _CONJUNCTION_RE.search(user_request) is not None
+        and _DEPENDENCY_RE.search(user_request) is None
+        and _ACTION_RE.search(user_request) is None
+    )
+
+
+async def run_parallel(user_request: str, members: List[Tuple[str, Agent]], model: OpenAIChat, memory: Memory, user_id: str, session_id: Optional[str], tz: str, now: str):
+    """Run independent agents concurrently, then merge their answers"""
+    results = await asyncio.gather(
+        *[
+            agent.arun(f"{user_request}\n\nOnly handle the {agent_name} part of this request.", user_id=user_id)
+            for agent_name, agent in members
+        ],
+        return_exceptions=True,
+    )
+    
+    sections = []
+    for (agent_name, _), result in zip(members, results):
+        if isinstance(result, BaseException):
+            sections.append(f"## {agent_name}\nFailed: {result}")
+        else:
+            sections.append(f"## {agent_name}\n{result.content}")
+    
+    from agno.agent import Agent
+    
+    # The synthesizer answers in the team's session, so follow-ups see this turn
+    synthesizer = Agent(
+        name="Ubik AI",
+        model=model,
+        instructions=[
+            "Combine the agent results below into one clear answer to the user's request.",
+            "Don't mention the agents; keep every fact and ID they returned.",
+            "Use markdown formatting for better readability",
+            f"user's current time is: {now}",
+            f"user's timezone is: {tz}",
+        ],
+        markdown=True,
+        memory=memory,
+        enable_agentic_memory=True,
+        enable_user_memories=True,
+        add_history_to_messages=True,
+        num_history_runs=3,
+        enable_session_summaries=True,
+        user_id=user_id,
+        session_id=session_id,
+    )
+    response_stream = await synthesizer.arun(
+        f"User request: {user_request}\n\n" + "\n\n".join(sections), stream=True, user_id=user_id
+    )
+    
+    print("\n==RESPONSE==")
+    await print_stream(response_stream, "RunResponseContent")
+
+
+def _app_of(conn) -> str:
+    """Lowercase app name of a Composio connection ('' if unknown)"""
+    return str(getattr(conn, 'appName', '') or getattr(conn, 'app_name', '') or getattr(conn, 'app', '') or '').lower()
+
+
+def _connection_id_of(conn) -> Optional[str]:
+    """ID of a Composio connection, if it has one"""
+    return getattr(conn, 'id', None) or getattr(conn, 'connectedAccountId', None)
+
+
 def list_all_apps(composio_api_key: str):
     """List all available apps"""
-    print("📱 Available Apps:")
-    print()
+    lines = ["📱 Available Apps:", ""]
 
     oauth_apps = ["gmail", "googlecalendar", "googledrive", "slack", "google_maps"]
     no_auth_apps = ["weathermap", "composio_search", "desktop_commander"]
     
     for i, app in enumerate(oauth_apps, 1):
-        print(f"{i}. {app} (needs oauth)")
+        lines.append(f"{i}. {app} (needs oauth)")
     
     for i, app in enumerate(no_auth_apps, len(oauth_apps) + 1):
-        print(f"{i}. {app} (no oauth) (no need to connect)")
+        lines.append(f"{i}. {app} (no oauth) (no need to connect)")
+    
+    sys.stdout.write("\n".join(lines) + "\n")
 
 
-def connect_app(app_name: str, entity_id: str, composio_api_key: str):
+async def connect_app(app_name: str, entity_id: str, composio_api_key: str):
     """Connect to an OAuth app"""
     if app_name not in OAUTH_APPS:
         print(f"❌ {app_name} doesn't need authentication")
         return
     
     try:
-        toolset = ComposioToolSet(api_key=composio_api_key, entity_id=entity_id)
-        entity = toolset.get_entity(entity_id)
+        toolset = get_toolset(composio_api_key, entity_id)
+        entity = await asyncio.to_thread(toolset.get_entity, entity_id)
         
         # First check if already connected
-        connections = entity.get_connections()
+        connections = await asyncio.to_thread(entity.get_connections)
+        app_key = app_name.lower()
         for conn in connections:
-            conn_app = getattr(conn, 'appName', '') or getattr(conn, 'app_name', '') or getattr(conn, 'app', '')
-            if conn_app and str(conn_app).lower() == app_name.lower():
-                conn_status = getattr(conn, 'status', '')
-                if conn_status.lower() in ['active', 'connected']:
-                    connection_id = getattr(conn, 'id', None) or getattr(conn, 'connectedAccountId', None)
+            if _app_of(conn) == app_key:
+                if getattr(conn, 'status', '').lower() in _ACTIVE_STATUSES:
+                    connection_id = _connection_id_of(conn)
                     print(f"✅ Already connected to {app_name}")
                     if connection_id:
                         print(f"📋 Connection ID: {connection_id}")
                     return
         
         # Not connected, initiate new connection
-        connection_request = entity.initiate_connection(app_name=app_name)
+        connection_request = await asyncio.to_thread(entity.initiate_connection, app_name=app_name)
         auth_url = getattr(connection_request, 'redirectUrl', None)
         
         if auth_url:
@@ -169,253 +529,166 @@ def connect_app(app_name: str, entity_id: str, composio_api_key: str):
         print(f"❌ Error connecting {app_name}: {e}")
 
 
-def list_connected_apps(entity_id: str, composio_api_key: str):
+async def list_connected_apps(entity_id: str, composio_api_key: str):
     """List all connected apps"""
     try:
-        toolset = ComposioToolSet(api_key=composio_api_key, entity_id=entity_id)
-        entity = toolset.get_entity(entity_id)
-        connections = entity.get_connections()
+        toolset = get_toolset(composio_api_key, entity_id)
+        entity = await asyncio.to_thread(toolset.get_entity, entity_id)
+        connections = await asyncio.to_thread(entity.get_connections)
         
-        print("📱 Connected Apps:")
-        print()
+        lines = ["📱 Connected Apps:", ""]
         
-        # Create a dict to track connected apps
-        connected_apps = {}
-        for conn in connections:
-            conn_app = getattr(conn, 'appName', '') or getattr(conn, 'app_name', '') or getattr(conn, 'app', '')
-            conn_status = getattr(conn, 'status', '')
-            connection_id = getattr(conn, 'id', None) or getattr(conn, 'connectedAccountId', None)
-            
-            if conn_app:
-                connected_apps[conn_app.lower()] = {
-                    'status': conn_status,
-                    'connection_id': connection_id,
-                    'is_active': conn_status.lower() in ['active', 'connected']
-                }
+        # Map each app to its connection in one pass
+        connected_apps = {_app_of(conn): conn for conn in connections}
+        connected_apps.pop('', None)
         
         all_apps = OAUTH_APPS + NO_AUTH_APPS
         
         for i, app in enumerate(all_apps, 1):
             if app in OAUTH_APPS:
-                app_info = connected_apps.get(app.lower(), {})
-                is_connected = app_info.get('is_active', False)
+                conn = connected_apps.get(app)
+                is_connected = conn is not None and getattr(conn, 'status', '').lower() in _ACTIVE_STATUSES
                 status = "connected" if is_connected else "not connected"
+                connection_id = is_connected and _connection_id_of(conn)
                 
-                if is_connected and app_info.get('connection_id'):
-                    print(f"{i}. {app} ({status}) - ID: {app_info['connection_id']}")
+                if connection_id:
+                    lines.append(f"{i}. {app} ({status}) - ID: {connection_id}")
                 else:
-                    print(f"{i}. {app} ({status})")
+                    lines.append(f"{i}. {app} ({status})")
             else:
                 status = "connected"  # No auth needed
-                print(f"{i}. {app} ({status})")
+                lines.append(f"{i}. {app} ({status})")
+        
+        sys.stdout.write("\n".join(lines) + "\n")
             
     except Exception as e:
         print(f"❌ Error listing connections: {e}")
 
 
-async def create_dynamic_team(user_request: str, model:OpenAIChat, agent_selection_model:OpenAIChat, toolset: ComposioToolSet, memory: Memory, storage: SqliteStorage, user_id: str):
+async def create_dynamic_team(user_request: str, model:OpenAIChat, agent_selection_model:OpenAIChat, composio_api_key: str, entity_id: str, memory: Memory, storage: SqliteStorage, user_id: str, session_id: Optional[str] = None):
     """Create team dynamically based on AI selection"""
+    from agno.agent import Agent
+    
+    tz = system_timezone()
+    home = get_home_directory()
+    now = get_user_time()
+    
+    # Tool fetches per app, started as soon as the selector names the agents
+    tool_tasks: Dict[str, asyncio.Future] = {}
+    
+    def fetch_tools(agent_names: List[str]):
+        for agent_name in agent_names:
+            app_name = AGENT_TO_APP.get(agent_name, agent_name)
+            if app_name in get_tool_actions() and app_name not in tool_tasks:
+                tool_tasks[app_name] = fetch_app_tools(composio_api_key, entity_id, app_name)
     
     # Get AI selection
-    selection = await smart_agent_selector(user_request, agent_selection_model)
+    selection = await smart_agent_selector(user_request, agent_selection_model, on_agents=fetch_tools)
     needed_agents = selection.get("agents", [])
     needs_filesystem = selection.get("needs_filesystem", False)
     
     print(f"🎯 Selected agents: {', '.join(needed_agents)}" + 
           (f" + filesystem" if needs_filesystem else ""))
     
-    # Map agent names to app names
-    agent_to_app = {
-        "gmail": "gmail",
-        "googlecalendar": "googlecalendar",
-        "googledrive": "googledrive",
-        "slack": "slack",
-        "weather": "weathermap",
-        "composio_search": "composio_search"
-    }
+    # Fetch tools for every selected app concurrently, reusing fetches already started
+    fetch_tools(needed_agents)
+    selected = [(agent_name, AGENT_TO_APP.get(agent_name, agent_name)) for agent_name in needed_agents]
+    selected = [(agent_name, app_name) for agent_name, app_name in selected if app_name in tool_tasks]
+    # Fetches for apps that weren't selected are left to finish and fill the cache
+    tools_list = await asyncio.gather(
+        *[asyncio.shield(tool_tasks[app_name]) for _, app_name in selected],
+        return_exceptions=True,
+    )
     
     # Create agents
     agents = []
-    for agent_name in needed_agents:
-        app_name = agent_to_app.get(agent_name, agent_name)
+    members = []
+    for (agent_name, app_name), tools in zip(selected, tools_list):
+        if isinstance(tools, Exception):
+            print(f"⚠️  Failed to create {agent_name} agent: {tools}")
+            continue
         
-        if app_name in TOOL_ACTIONS:
-            try:
-                if app_name in OAUTH_APPS:
-                    tools = toolset.get_tools(
-                        actions=TOOL_ACTIONS[app_name], 
-                        check_connected_accounts=True
-                    )
-                else:
-                    tools = toolset.get_tools(actions=TOOL_ACTIONS[app_name])
-                
-                agent = Agent(
-                    name=f"{agent_name.title()} Agent",
-                    role=f"Handle {agent_name} tasks",
-                    model=model,
-                    instructions=[
-                        f"Handle {agent_name} tasks efficiently.",
-                        "Use timezone and local currency/units as per the user's location.",
-                        f"user's current time is: {get_user_time()}",
-                        f"user's timezone is: {system_timezone()}",
-                        "** NOTE: DON'T PASS TIMEZONE WHILE CALLING GOOGLECALENDAR_FIND_EVENT",
-                        "**NOTE: WHILE WORKING WITH GMAIL, ALWAYS GET THE EMAIL/MESSAGE ID FOR OPERATIONS",
-                        "**NOTE: WHILE WORKING WITH GOOGLE DRIVE, ALWAYS GET THE FILE ID FOR OPERATIONS",
-                        "**NOTE: WHILE WORKING WITH GMAIL ATTACHMENTS, USE GMAIL_GET_ATTACHMENT ACTION" ,
-                    ],
-                    tools=tools,
-                    memory=memory,
-                    storage=storage,
-                    enable_agentic_memory=True,
-                    enable_user_memories=True,
-                    add_history_to_messages=True,
-                    num_history_runs=3,
-                    markdown=True,
-                    add_datetime_to_instructions=True,
-                    timezone_identifier=system_timezone()
-                )
-                # memory.clear()  # Clear memory for each agent
-                agents.append(agent)
+        try:
+            agent = Agent(
+                name=f"{agent_name.title()} Agent",
+                role=f"Handle {agent_name} tasks",
+                model=model,
+                instructions=[
+                    f"Handle {agent_name} tasks efficiently.",
+                    "Use timezone and local currency/units as per the user's location.",
+                    f"user's current time is: {now}",
+                    f"user's timezone is: {tz}",
+                    "** NOTE: DON'T PASS TIMEZONE WHILE CALLING GOOGLECALENDAR_FIND_EVENT",
+                    "**NOTE: WHILE WORKING WITH GMAIL, ALWAYS GET THE EMAIL/MESSAGE ID FOR OPERATIONS",
+                    "**NOTE: WHILE WORKING WITH GOOGLE DRIVE, ALWAYS GET THE FILE ID FOR OPERATIONS",
+                    "**NOTE: WHILE WORKING WITH GMAIL ATTACHMENTS, USE GMAIL_GET_ATTACHMENT ACTION" ,
+                ],
+                tools=tools,
+                memory=memory,
+                storage=storage,
+                enable_agentic_memory=True,
+                enable_user_memories=True,
+                add_history_to_messages=True,
+                num_history_runs=3,
+                markdown=True,
+                add_datetime_to_instructions=True,
+                timezone_identifier=tz
+            )
+            # memory.clear()  # Clear memory for each agent
+            agents.append(agent)
+            members.append((agent_name, agent))
                 
-            except Exception as e:
-                print(f"⚠️  Failed to create {agent_name} agent: {e}")
+        except Exception as e:
+            print(f"⚠️  Failed to create {agent_name} agent: {e}")
     
     # Add filesystem agent if needed
     if needs_filesystem:
         try:
+            desktop_commander = await _get_or_create_fs_mcp()
+            filesystem_agent = Agent(
+                name="Ubik File System Commander",
+                role="Professional DevOps File Operations Specialist",
+                model=model,
+                tools=[desktop_commander],
+                instructions=[line.format(home=home, tz=tz, now=now) for line in _FS_INSTRUCTIONS_TEMPLATE],
+                add_datetime_to_instructions=True,
+                timezone_identifier=tz,
+                add_location_to_instructions=True,
+                user_id=user_id,
+                memory=memory,
+                storage=storage,
+                enable_agentic_memory=True,
+                enable_user_memories=True,
+                add_history_to_messages=True,
+                num_history_runs=3,
+            )
+            
+            # Create team with filesystem
+            team = _build_team(agents + [filesystem_agent], model, memory, user_id, session_id, tz, home, now)
+            
+            print(f"👥 Team created with {len(agents)+1} agents")
+            
+            # Stream response
+            response_stream = await team.arun(user_request, stream=True, user_id=user_id)
 
-            server_params = StdioServerParameters(
-                command="npx",
-                args=["-y", "@wonderwhy-er/desktop-commander@latest"],
-                    )
-
-            async with MCPTools(server_params=server_params) as desktop_commander:
-                filesystem_agent = Agent(
-                    name="Ubik File System Commander",
-                    role="Professional DevOps File Operations Specialist",
-                    model=model,
-                    tools=[desktop_commander],
-                    instructions=[
-                        "You're an expert Linux/macOS command-line specialist with DevOps expertise.",
-                        "Safety first: NEVER run destructive commands (rm -rf, dd, mv to root, etc.)",
-                        f"Always create and use the 'Ubik AI' directory in the user's Desktop({get_home_directory()}/Desktop/Ubik AI) as default workspace:",
-                        f"  1. Check existence: `ls {get_home_directory()}/Desktop/Ubik AI`",
-                        f"  2. Create if missing: `mkdir -p {get_home_directory()}/Desktop/Ubik AI`",
-                        "  3. Use as default path when user doesn't specify location",
-                        "default path: ~/Desktop/Ubik AI or /Users/<username>/Desktop/Ubik AI",
-                        "NOTE: If user doesn't specify a path, use the default Ubik AI directory on Desktop.",
-                        "Professional standards:",
-                        "  - Validate paths before operations",
-                        "  - Use absolute paths with proper escaping",
-                        "  - Confirm disk space before large operations",
-                        "  - Preserve permissions and metadata",
-                        "Special handling:",
-                        "  - For media files: maintain originals, create copies for edits",
-                        "  - For code: preserve git history and directory structure",
-                        "User experience:",
-                        "  - Provide clear progress indicators",
-                        "  - Suggest optimizations (e.g., compression for large files)",
-                        "  - Estimate time/resources for long operations",
-                         f"user's current time is: {get_user_time()}",
-                        f"user's timezone is: {system_timezone()}",
-                        "** NOTE: Provide the path to file or folder if needed after completing the operation",
-                    ],
-                    add_datetime_to_instructions=True,
-                    timezone_identifier=system_timezone(),
-                    add_location_to_instructions=True,
-                    user_id=user_id,
-                    memory=memory,
-                    storage=storage,
-                    enable_agentic_memory=True,
-                    enable_user_memories=True,
-                    add_history_to_messages=True,
-                    num_history_runs=3,
-                )
-                
-                # Create team with filesystem
-                team = Team(
-                    name="Ubik AI",
-                    description='Your personal AI assistant',
-                    mode="coordinate",
-                    model=model,
-                    members=agents + [filesystem_agent],
-                    instructions=[
-                        "Collaborate to provide comprehensive assistance",
-                        "Use tools effectively to fetch and create information",
-                        "Provide clear and actionable responses",
-                        "Use markdown formatting for better readability",
-                        "Use timezone and local currency/units as per the user's location.",
-                        "When someone ask about you, tell them you are Ubik AI, a personal assistant that can help with various tasks like checking emails, scheduling events, searching the web(composio_search), and managing files. You're designed to assist users in their daily tasks and provide information quickly and efficiently. You're secure and respect user privacy",
-                        f"user's timezone is: {system_timezone()} if you want to determine user's timezone, use `date` command or locaition information",
-                        f"user's default directory is: {get_home_directory()}/Desktop/Ubik AI",
-                        # "don't ask follow-up questions, just provide the answer",
-                         f"user's current time is: {get_user_time()}",
-                        f"user's timezone is: {system_timezone()}",
-                    ],
-                    markdown=True,
-                    add_datetime_to_instructions=True,
-                    add_location_to_instructions=True,
-                    memory=memory,
-                    # storage=storage,
-                    enable_agentic_memory=True,
-                    enable_user_memories=True,
-                    add_history_to_messages=True,
-                    num_history_runs=3,
-                    user_id=user_id,
-                    enable_session_summaries=True,
-
-                )
-                
-                print(f"👥 Team created with {len(agents)+1} agents")
-                
-                # Stream response
-                response_stream = await team.arun(user_request, stream=True, user_id=user_id)
-
-                print("\n==RESPONSE==")
-                async for event in response_stream:
-                    if event.event == "TeamRunResponseContent":
-                        print(event.content, end="", flush=True)
-                    elif event.event == "TeamToolCallStarted":
-                        # print(f"\n🔧 Tool call started: {event.tool}")
-                        ...
+            print("\n==RESPONSE==")
+            await print_stream(response_stream, "TeamRunResponseContent")
         
         except Exception as e:
             print(f"❌ Error with filesystem agent: {e}")
             needs_filesystem = False
+            # desktop_commander may have died; start a fresh one next time
+            await close_fs_mcp()
+    
+    if not needs_filesystem and is_independent_request(user_request, [name for name, _ in members]):
+        # Independent sub-tasks don't need a coordinator; fan them out
+        print(f"⚡ Running {len(members)} agents in parallel")
+        await run_parallel(user_request, members, model, memory, user_id, session_id, tz, now)
+        return
     
     if not needs_filesystem:
         # Create team without filesystem
-        team = Team(
-            name="Ubik AI", 
-            description='Your personal AI assistant',
-            mode="coordinate",
-            model=model,
-            members=agents,
-            instructions=[
-                "Collaborate to provide comprehensive assistance",
-                "Use tools effectively to fetch and create information",
-                "Provide clear and actionable responses", 
-                "Use markdown formatting for better readability",
-                "Use timezone and local currency/units as per the user's location.",
-                "When someone ask about you, tell them you are Ubik AI, a personal assistant that can help with various tasks like checking emails, scheduling events, searching the web(composio_search), and managing files. You're designed to assist users in their daily tasks and provide information quickly and efficiently. You're secure and respect user privacy",
-                f"user's timezone is: {system_timezone()} if you want to determine user's timezone, use `date` command or locaition information",
-                f"user's default directory is: {get_home_directory()}/Desktop/Ubik AI",
-                f"user's current time is: {get_user_time()}",
-                f"user's timezone is: {system_timezone()}",
-            ],
-            markdown=True,
-            add_datetime_to_instructions=True,
-            add_location_to_instructions=True,
-            memory=memory,
-            # storage=storage,
-            enable_agentic_memory=True,
-            enable_user_memories=True,
-            add_history_to_messages=True,
-            num_history_runs=3,
-            enable_session_summaries=True,
-            user_id=user_id,
-
-        )
+        team = _build_team(agents, model, memory, user_id, session_id, tz, home, now)
         
         print(f"👥 Team created with {len(agents)} agents")
         
@@ -423,24 +696,42 @@ async def create_dynamic_team(user_request: str, model:OpenAIChat, agent_selecti
         response_stream = await team.arun(user_request, stream=True, user_id=user_id)
         
         print("\n==RESPONSE==")
-        async for event in response_stream:
-            if event.event == "TeamRunResponseContent":
-                print(event.content, end="", flush=True)
-            elif event.event == "TeamToolCallStarted":
-                # print(f"\n🔧 Tool call started: {event.tool}")
-                ...
+        await print_stream(response_stream, "TeamRunResponseContent")
 
 
-async def process_query(user_request: str, entity_id: str, openai_key: str, composio_api_key: str, model:OpenAIChat, agent_selection_model:OpenAIChat, memory: Memory, storage: SqliteStorage, user_id: str):
+def _build_team(members: List[Agent], model: OpenAIChat, memory: Memory, user_id: str, session_id: Optional[str], tz: str, home: str, now: str) -> Team:
+    """Create the coordinating Ubik AI team for the given members"""
+    from agno.team.team import Team
+    
+    return Team(
+        name="Ubik AI",
+        description='Your personal AI assistant',
+        mode="coordinate",
+        model=model,
+        members=members,
+        instructions=[line.format(home=home, tz=tz, now=now) for line in _TEAM_INSTRUCTIONS_TEMPLATE],
+        markdown=True,
+        add_datetime_to_instructions=True,
+        add_location_to_instructions=True,
+        memory=memory,
+        # storage=storage,
+        enable_agentic_memory=True,
+        enable_user_memories=True,
+        add_history_to_messages=True,
+        num_history_runs=3,
+        enable_session_summaries=True,
+        user_id=user_id,
+        session_id=session_id,
+    )
+
+
+async def process_query(user_request: str, entity_id: str, openai_key: str, composio_api_key: str, model:OpenAIChat, agent_selection_model:OpenAIChat, memory: Memory, storage: SqliteStorage, user_id: str, session_id: Optional[str] = None):
     """Process a user query"""
     try:
-        
-        toolset = ComposioToolSet(api_key=composio_api_key, entity_id=entity_id)
-        
         print("🤖 Processing your request...")
         print("=" * 50)
 
-        await create_dynamic_team(user_request, model, agent_selection_model, toolset, memory, storage, user_id)
+        await create_dynamic_team(user_request, model, agent_selection_model, composio_api_key, entity_id, memory, storage, user_id, session_id)
 
         print("\n" + "=" * 50)
         print("✅ Completed!")
@@ -449,8 +740,74 @@ async def process_query(user_request: str, entity_id: str, openai_key: str, comp
         print(f"❌ Error: {e}")
 
 
+def read_line(prompt: str) -> asyncio.Future:
+    """Read a line of input without blocking the event loop
+
+    The read happens on a daemon thread: an executor thread stuck in input()
+    would keep the process alive after Ctrl-C.
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+    
+    def settle(line: Optional[str], error: Optional[BaseException]):
+        if future.done():
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(line)
+    
+    def read():
+        try:
+            line, error = input(prompt), None
+        except EOFError as e:
+            line, error = None, e
+        try:
+            loop.call_soon_threadsafe(settle, line, error)
+        except RuntimeError:
+            # The loop already closed
+            pass
+    
+    threading.Thread(target=read, name="ubik-stdin", daemon=True).start()
+    return future
+
+
+async def run_session(user_request: Optional[str], entity_id: str, openai_key: str, composio_api_key: str, model:OpenAIChat, agent_selection_model:OpenAIChat, memory: Memory, storage: SqliteStorage, user_id: str):
+    """Process one query, or keep prompting for queries when user_request is None"""
+    # Every query in a session shares one session id, so follow-ups see earlier turns
+    session_id = str(uuid.uuid4())
+    warmup = None
+    try:
+        if user_request is not None:
+            await process_query(user_request, entity_id, openai_key, composio_api_key, model, agent_selection_model, memory, storage, user_id, session_id)
+            return
+        
+        # Sessions run many queries, so fetching every app's tools up front pays off;
+        # one-shot queries skip this and fetch only the tools they need
+        warmup = asyncio.create_task(warmup_tools(composio_api_key, entity_id))
+        
+        print("💬 Interactive mode - type 'exit' to quit")
+        while True:
+            try:
+                line = (await read_line("\n🧑 You: ")).strip()
+            except EOFError:
+                break
+            if line.lower() in ("exit", "quit"):
+                break
+            if line:
+                await process_query(line, entity_id, openai_key, composio_api_key, model, agent_selection_model, memory, storage, user_id, session_id)
+    finally:
+        if warmup is not None:
+            warmup.cancel()
+            try:
+                await warmup
+            except asyncio.CancelledError:
+                pass
+        await close_fs_mcp()
+
 
 # get user's home directory
+@functools.lru_cache(maxsize=1)
 def get_home_directory() -> str:
     """Get the home directory of the current user."""
     return os.path.expanduser("~")
@@ -461,13 +818,39 @@ def get_user_time() -> str:
     from datetime import datetime
     return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
+
+def _iana_key_from_tz(tz: str) -> Optional[str]:
+    """Get the IANA zone name from a TZ value, or None if it isn't one
+
+    Paths like ":/etc/localtime" and POSIX rules like "CET-1CEST,M3.5.0" are rejected.
+    """
+    from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+    
+    tz = tz.lstrip(':')
+    if 'zoneinfo/' in tz:
+        tz = tz.split('zoneinfo/')[-1]
+    elif tz.startswith('/'):
+        return None
+    if not tz:
+        return None
+    try:
+        ZoneInfo(tz)
+    except (ZoneInfoNotFoundError, ValueError, OSError):
+        return None
+    return tz
+
+
 # get user's timezone
+@functools.lru_cache(maxsize=1)
 def system_timezone() -> str:
     """Get the system timezone."""
     
     #determine of os
     if os.name == 'posix':  # Unix-like systems (Linux, macOS)
-        # return os.popen('date +%Z').read().strip()
+        # An explicit TZ (e.g. "Europe/Berlin" or ":Europe/Berlin") wins over /etc/localtime
+        tz = _iana_key_from_tz(os.environ.get('TZ', ''))
+        if tz:
+            return tz
         # use readlink /etc/localtime | sed 's|.*/zoneinfo/||'
         try:
             return os.readlink('/etc/localtime').split('zoneinfo/')[1]
@@ -475,18 +858,60 @@ def system_timezone() -> str:
             print(f"Error getting timezone: {e}")
             return "Unknown"
     elif os.name == 'nt':  # Windows
-        return os.popen('tzutil /g').read().strip()
+        # tzlocal reads the registry without spawning a process
+        try:
+            from tzlocal import get_localzone_name
+            return get_localzone_name()
+        except Exception:
+            pass
+        import subprocess
+        try:
+            return subprocess.run(['tzutil', '/g'], capture_output=True, text=True).stdout.strip()
+        except OSError as e:
+            print(f"Error getting timezone: {e}")
+            return "Unknown"
     else:
         raise NotImplementedError("Unsupported operating system")
 
+
+def tune_sqlite_engine(engine):
+    """Apply _SQLITE_PRAGMAS to every connection of an agno-created engine"""
+    from sqlalchemy import event
+    
+    @event.listens_for(engine, "connect")
+    def _set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in _SQLITE_PRAGMAS:
+            cursor.execute(pragma)
+        cursor.close()
+    
+    # agno already opened a connection while inspecting the database; drop it
+    # so every pooled connection gets the pragmas
+    engine.dispose()
+
+def _exit_missing_dependencies(e: ImportError):
+    """Explain how to install the missing packages and exit"""
+    print(f"❌ Missing dependencies: {e}")
+    print("Please install required packages:")
+    print("pip install agno composio-agno openai mcp")
+    sys.exit(1)
+
 def main():
     """Main CLI function"""
+    # uvloop is optional (no Windows support); fall back to the stock loop
+    try:
+        import uvloop
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    except ImportError:
+        pass
+    
     parser = argparse.ArgumentParser(
         description="Ubik AI - Your Personal Assistant",
         formatter_class=argparse.RawDescriptionHelpFormatter,
         epilog="""
 Examples:
   ubik --query="what's the weather?" --entity_id=john@doe.com --openai_key=sk-xxx --composio_api_key=xxx
+  ubik --repl --entity_id=john@doe.com --openai_key=sk-xxx --composio_api_key=xxx
   ubik --list_apps --composio_api_key=xxx
   ubik --connect_app=gmail --entity_id=john@doe.com --composio_api_key=xxx
   ubik --list_connected_apps --entity_id=john@doe.com --composio_api_key=xxx
@@ -496,6 +921,7 @@ Examples:
     # Main actions (mutually exclusive)
     action_group = parser.add_mutually_exclusive_group(required=True)
     action_group.add_argument("--query", help="Ask AI a question")
+    action_group.add_argument("--repl", action="store_true", help="Ask AI questions interactively")
     action_group.add_argument("--list_apps", action="store_true", help="List all available apps")
     action_group.add_argument("--connect_app", help="Connect to an OAuth app")
     action_group.add_argument("--list_connected_apps", action="store_true", help="List connected apps")
@@ -509,52 +935,73 @@ Examples:
     
     print_banner()
 
-    model = OpenAIChat("o4-mini-2025-04-16", api_key=args.openai_key)
-    agent_selection_model = OpenAIChat("gpt-4.1-nano-2025-04-14", api_key=args.openai_key)
+    # Validate required parameters based on action
+    if args.query or args.repl:
+        if not all([args.entity_id, args.composio_api_key, args.openai_key]):
+            print("❌ For queries, you need: --entity_id, --composio_api_key, and --openai_key")
+            sys.exit(1)
+
+        try:
+            from agno.models.openai import OpenAIChat
+            from agno.memory.v2.memory import Memory
+            from agno.storage.sqlite import SqliteStorage
+            from memory_db import WriteBehindMemoryDb
+            # Imported again where used; checked here to fail before doing any work
+            import agno.agent
+            import agno.team.team
+            import agno.tools.mcp
+            import composio_agno
+            import mcp
+            import sqlalchemy
+        except ImportError as e:
+            _exit_missing_dependencies(e)
+
+        model = OpenAIChat("o4-mini-2025-04-16", api_key=args.openai_key)
+        agent_selection_model = OpenAIChat("gpt-4.1-nano-2025-04-14", api_key=args.openai_key)
     
-    # UserId for the memories
-    user_id = args.entity_id
-    # Database file for memory and storage
-    db_file = "tmp/agent.db"    
+        # UserId for the memories
+        user_id = args.entity_id
+        # Database file for memory and storage
+        db_file = "tmp/agent.db"
 
-    # Initialize memory.v2
-    memory = Memory(
-        # Use any model for creating memories
-        model=OpenAIChat(id="o4-mini-2025-04-16", api_key=args.openai_key),
-        db=SqliteMemoryDb(table_name="user_memories", db_file=db_file),
-    )
+        # agno's SQLite classes ignore db_engine (they fall back to an in-memory
+        # database), so let them build their engines from db_file and tune those
+        # Memory writes go through a background queue so agent runs don't wait on disk
+        memory_db = WriteBehindMemoryDb(table_name="user_memories", db_file=db_file)
+        tune_sqlite_engine(memory_db.db_engine)
 
-    # Initialize storage
-    storage = SqliteStorage(table_name="agent_sessions", db_file=db_file)
-
-    # # Initialize Agent
-    # memory_agent = Agent(
-    #     model=OpenAIChat(id="o4-mini-2025-04-16", api_key=args.openai_key),
-    #     # Store memories in a database
-    #     memory=memory,
-    #     # Give the Agent the ability to update memories
-    #     enable_agentic_memory=True,
-    #     # OR - Run the MemoryManager after each response
-    #     enable_user_memories=True,
-    #     # Store the chat history in the database
-    #     storage=storage,
-    #     # Add the chat history to the messages
-    #     add_history_to_messages=True,
-    #     # Number of history runs
-    #     num_history_runs=3,
-    #     markdown=True,
-    # )
-
-    # memory.clear()
+        # Initialize memory.v2
+        memory = Memory(
+            # Use any model for creating memories
+            model=OpenAIChat(id="o4-mini-2025-04-16", api_key=args.openai_key),
+            db=memory_db,
+        )
 
+        # Initialize storage
+        storage = SqliteStorage(table_name="agent_sessions", db_file=db_file)
+        tune_sqlite_engine(storage.db_engine)
 
-    # Validate required parameters based on action
-    if args.query:
-        if not all([args.entity_id, args.composio_api_key, args.openai_key]):
-            print("❌ For queries, you need: --entity_id, --composio_api_key, and --openai_key")
-            sys.exit(1)
+        # # Initialize Agent
+        # memory_agent = Agent(
+        #     model=OpenAIChat(id="o4-mini-2025-04-16", api_key=args.openai_key),
+        #     # Store memories in a database
+        #     memory=memory,
+        #     # Give the Agent the ability to update memories
+        #     enable_agentic_memory=True,
+        #     # OR - Run the MemoryManager after each response
+        #     enable_user_memories=True,
+        #     # Store the chat history in the database
+        #     storage=storage,
+        #     # Add the chat history to the messages
+        #     add_history_to_messages=True,
+        #     # Number of history runs
+        #     num_history_runs=3,
+        #     markdown=True,
+        # )
 
-        asyncio.run(process_query(args.query, args.entity_id, args.openai_key, args.composio_api_key, model, agent_selection_model, memory, storage, user_id))
+        # memory.clear()
+
+        asyncio.run(run_session(args.query, args.entity_id, args.openai_key, args.composio_api_key, model, agent_selection_model, memory, storage, user_id))
 
     elif args.list_apps:
         if not args.composio_api_key:
@@ -568,14 +1015,24 @@ Examples:
             print("❌ For app connection, you need: --entity_id and --composio_api_key")
             sys.exit(1)
         
-        connect_app(args.connect_app, args.entity_id, args.composio_api_key)
+        try:
+            import composio_agno
+        except ImportError as e:
+            _exit_missing_dependencies(e)
+        
+        asyncio.run(connect_app(args.connect_app, args.entity_id, args.composio_api_key))
     
     elif args.list_connected_apps:
         if not all([args.entity_id, args.composio_api_key]):
             print("❌ For listing connections, you need: --entity_id and --composio_api_key")
             sys.exit(1)
         
-        list_connected_apps(args.entity_id, args.composio_api_key)
+        try:
+            import composio_agno
+        except ImportError as e:
+            _exit_missing_dependencies(e)
+        
+        asyncio.run(list_connected_apps(args.entity_id, args.composio_api_key))
 
 
 if __name__ == "__main__":
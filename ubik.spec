@@ -1,7 +1,9 @@
 # -*- mode: python ; coding: utf-8 -*-
 from PyInstaller.utils.hooks import collect_submodules
 
-hiddenimports = ['agno.models.openai', 'composio_agno', 'agno.tools.mcp', 'mcp', 'sqlalchemy', 'agno.team.team', 'agno.agent']
+# agno/composio_agno submodules are collected below and openai/pydantic/mcp are
+# found by the analyzer; only list what is imported lazily at runtime
+hiddenimports = ['sqlalchemy']
 hiddenimports += collect_submodules('agno')
 hiddenimports += collect_submodules('composio_agno')
 
@@ -10,14 +12,18 @@ a = Analysis(
     ['ubik.py'],
     pathex=[],
     binaries=[],
-    datas=[],
+    datas=[('ubik_tools.py', '.')],
     hiddenimports=hiddenimports,
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
-    excludes=['matplotlib', 'numpy', 'pandas', 'scipy', 'torch', 'tensorflow', 'jupyter', 'notebook', 'IPython', 'tkinter', 'PIL'],
+    excludes=[
+        'matplotlib', 'numpy', 'pandas', 'scipy',
+        'torch', 'tensorflow', 'jupyter', 'notebook',
+        'IPython', 'tkinter', 'PIL', 'cv2',
+        'sklearn', 'transformers', 'pyarrow', 'sympy', 'pytest',
+    ],
     noarchive=False,
-    optimize=0,
 )
 pyz = PYZ(a.pure)
 
@@ -31,8 +37,7 @@ exe = EXE(
     debug=False,
     bootloader_ignore_signals=False,
     strip=False,
-    upx=True,
-    upx_exclude=[],
+    upx=False,                  # UPX slows startup: the exe must decompress itself first
     runtime_tmpdir=None,
     console=True,
     disable_windowed_traceback=False,